@@ -13,162 +13,13 @@ Public API
 get_frame(mask: np.ndarray) -> pygame.Surface
 """
 from __future__ import annotations
-import itertools, math, random, time
-from typing import List, Tuple
+import math, time
 import numpy as np
 import pygame
-from PIL import Image, ImageEnhance, ImageFilter
-
-# --------------------------------------------------------------------------- #
-# Helpers                                                                     #
-# --------------------------------------------------------------------------- #
-def wrap(pos: Tuple[float, float], width: int, height: int) -> Tuple[float, float]:
-    return (pos[0] % width, pos[1] % height)
-
-def polygon_area(pts) -> float:
-    pts = np.asarray(pts)
-    x, y = pts[:, 0], pts[:, 1]
-    return 0.5 * (x @ np.roll(y, -1) - y @ np.roll(x, -1))
-
-# --------------------------------------------------------------------------- #
-# Cell                                                                        #
-# --------------------------------------------------------------------------- #
-class Cell:
-    def __init__(self, width, height, base_radius, vertices, friction, brownian_d, curvature_relax, radial_relax, protrusion_gain, impulse, ruffle_std, rng):
-        self.width = width
-        self.height = height
-        self.base_r = base_radius * (0.85 + 0.3 * rng.random())
-        self.r = np.full(vertices, self.base_r)
-        self.angles = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
-        self.area0 = math.pi * self.base_r ** 2
-        self.vel = np.zeros(2)
-        self.vertices = vertices
-        self.friction = friction
-        self.brownian_d = brownian_d
-        self.curvature_relax = curvature_relax
-        self.radial_relax = radial_relax
-        self.protrusion_gain = protrusion_gain
-        self.impulse = impulse
-        self.ruffle_std = ruffle_std
-        self.rng = rng
-        self.center = np.array([rng.uniform(0, width), rng.uniform(0, height)], float)
-
-    # ---------------- stimulation ----------------
-    def stimulate(self, mask: np.ndarray):
-        """
-        For every vertex that falls on a True pixel in *mask*,
-        increase its radius outward.  No periodic wrapping: the
-        mask acts like a real camera sensor.
-        """
-        # raw vertex coordinates (float)
-        vx = self.center[0] + np.cos(self.angles) * self.r
-        vy = self.center[1] + np.sin(self.angles) * self.r
-
-        # keep only vertices inside the screen
-        inside = (vx >= 0) & (vx < self.width) & (vy >= 0) & (vy < self.height)
-        if not inside.any():
-            return
-
-        ix = vx[inside].astype(int)
-        iy = vy[inside].astype(int)
-        hit = mask[iy, ix]          # Boolean array, len = num_inside
-
-        if not hit.any():
-            return
-
-        # enlarge only the hit vertices
-        idx = np.nonzero(inside)[0][hit]   # indices in self.r that need protrusion
-        # 1) protrude stimulated vertices outward
-        self.r[idx] += self.protrusion_gain * self.base_r
-        self.r = np.clip(self.r, 0.4 * self.base_r, 2.2 * self.base_r)
-        self._conserve_area()
-
-         # 2) give the whole cell a kick toward the stimulated side
-        #    direction = vector from centre to mean of hit vertices
-        vx_hit = vx[idx]
-        vy_hit = vy[idx]
-        tgt = np.array([vx_hit.mean(), vy_hit.mean()])
-        vec = tgt - self.center
-        n = np.linalg.norm(vec)
-        if n:
-            self.vel += (vec / n) * self.impulse
-
-    # ---------------- physics update -------------
-    def update(self, dt: float):
-        amp = self.rng.normalvariate(0, math.sqrt(2 * self.brownian_d * dt))
-        ang = self.rng.uniform(0, 2 * math.pi)
-        self.vel += amp * np.array([math.cos(ang), math.sin(ang)])
-        self.center += self.vel * dt
-        self.center = np.array(wrap(self.center, self.width, self.height))
-        self.vel *= max(0.0, 1.0 - self.friction * dt)
-
-        self.r += self.rng.normalvariate(0, self.ruffle_std * self.base_r) * np.cos(
-            self.rng.randint(1, 3) * self.angles + self.rng.uniform(0, 2 * math.pi)
-        )
-        lap = np.roll(self.r, -1) + np.roll(self.r, 1) - 2 * self.r
-        self.r += self.curvature_relax * lap + self.radial_relax * (self.base_r - self.r)
-        self.r = np.clip(self.r, 0.4 * self.base_r, 2.2 * self.base_r)
-        self._conserve_area()
-
-    # ---------------- collision ------------------
-    def collide(self, other):
-        dvx = other.center[0] - self.center[0]
-        dvy = other.center[1] - self.center[1]
-        dvx -= self.width * round(dvx / self.width)
-        dvy -= self.height * round(dvy / self.height)
-        dvec = np.array([dvx, dvy])
-        dist = np.linalg.norm(dvec)
-        if dist == 0:
-            return
-        overlap = max(self.r) + max(other.r) - dist
-        if overlap <= 0:
-            return
-        n = dvec / dist
-        shift = 0.5 * (overlap + 0.5) * n
-        self.center -= shift
-        other.center += shift
-        self.center = np.array(wrap(self.center, self.width, self.height))
-        other.center = np.array(wrap(other.center, other.width, other.height))
-        self.vel[:] = 0
-        other.vel[:] = 0
-
-    # ---------------- rendering ------------------
-    def draw(self, surf: pygame.Surface):
-        rel = self._rel_pts()
-        layers = 6
-        for ox in (-self.width, 0, self.width):
-            for oy in (-self.height, 0, self.height):
-                pts = [(x + ox + self.center[0], y + oy + self.center[1]) for x, y in rel]
-                if not any(0 <= px <= self.width and 0 <= py <= self.height for px, py in pts):
-                    continue
-                for i in range(layers, 0, -1):
-                    s = i / layers
-                    shade = 80 + int(100 * s)
-                    scaled = [
-                        (
-                            self.center[0] + ox + (px - (self.center[0] + ox)) * s,
-                            self.center[1] + oy + (py - (self.center[1] + oy)) * s,
-                        )
-                        for px, py in pts
-                    ]
-                    pygame.draw.polygon(surf, (shade, shade, 255), scaled)
-                pygame.draw.polygon(surf, (0, 0, 0), pts, 1)
-                pygame.draw.circle(
-                    surf,
-                    (60, 60, 150),
-                    (int(self.center[0] + ox), int(self.center[1] + oy)),
-                    int(0.4 * self.base_r),
-                )
-
-    # ---------------- helpers --------------------
-    def _rel_pts(self):
-        return list(zip(np.cos(self.angles) * self.r, np.sin(self.angles) * self.r))
-
-    def _conserve_area(self):
-        pts = np.array([(x + self.center[0], y + self.center[1]) for x, y in self._rel_pts()])
-        area = abs(polygon_area(pts))
-        if area:
-            self.r *= math.sqrt(self.area0 / area)
+from scipy.ndimage import correlate1d
+from sim_kernels import (
+    candidate_pairs, clear_boxes, make_stimulate_kernel, make_update_kernel, rasterize_cells
+)
 
 # --------------------------------------------------------------------------- #
 # Module‑level state                                                          #
@@ -176,6 +27,18 @@ class Cell:
 pygame.init()
 
 class MicroscopeSim:
+    """
+    Cell state is kept as a structure of arrays so that every physics
+    step is a single pass over all cells (see sim_kernels.py):
+
+    centers  (N, 2)  cell centres in pixels
+    vel      (N, 2)  cell velocities
+    r        (N, V)  vertex radii, vertex *v* sits at ``angles[v]``
+    angles   (V,)    vertex angles, shared by all cells
+    vx, vy   (N, V)  vertex coordinates of the current frame
+    base_r   (N,)    rest radius of every cell
+    """
+
     def __init__(
         self,
         width=512,
@@ -214,75 +77,175 @@ class MicroscopeSim:
         self.noise_std = noise_std
         self.brightness = brightness
         self.overlay_mask = overlay_mask
-        self.rng = random.Random(rng_seed)
-        self._cells: List[Cell] = [
-            Cell(
-                self.width, self.height, self.base_radius, self.vertices, self.friction, self.brownian_d,
-                self.curvature_relax, self.radial_relax, self.protrusion_gain, self.impulse, self.ruffle_std, self.rng
-            ) for _ in range(self.nb_cells)
-        ]
-        self._last_time = time.perf_counter()
-        self._cell_layer = pygame.Surface((self.width, self.height))
+        self.rng = np.random.default_rng(rng_seed)
+        self.angles = np.linspace(0, 2 * math.pi, self.vertices, endpoint=False)
+        self.cos_ang = np.cos(self.angles)
+        self.sin_ang = np.sin(self.angles)
+        # cos/sin of the ruffle harmonics k * angles, one row per k = 0..3
+        harmonics = np.arange(4)[:, None] * self.angles
+        self._harm_cos = np.cos(harmonics)
+        self._harm_sin = np.sin(harmonics)
+        self._sin_dtheta = math.sin(2 * math.pi / self.vertices)
+        self._stimulate_cells = make_stimulate_kernel(self.vertices)
+        self._update_cells = make_update_kernel(self.vertices)
+        # filter buffers: 16-bit luma, 8-bit grey levels, int16 noisy image
+        self._levels = np.arange(256)
+        self._lum16 = np.empty((self.width, self.height), dtype=np.uint16)
+        self._lum_term = np.empty((self.width, self.height), dtype=np.uint16)
+        self._grey = np.empty((self.width, self.height), dtype=np.uint8)
+        self._blur_pass = np.empty((self.width, self.height), dtype=np.uint8)
+        self._blurred = np.empty((self.width, self.height), dtype=np.uint8)
+        # 1-D Gaussian taps for the separable blur, truncated at 4 sigma
+        tap = np.arange(-int(4 * blur_rad + 0.5), int(4 * blur_rad + 0.5) + 1)
+        taps = np.exp(-0.5 * (tap / blur_rad) ** 2) if blur_rad > 0 else np.ones(1)
+        self._blur_taps = taps / taps.sum()
+        self._noise_buf = np.empty((self.width, self.height), dtype=np.float32)
+        self._noisy = np.empty((self.width, self.height), dtype=np.int16)
+        self.reset()
 
     def reset(self):
-        self._cells = [
-            Cell(
-                self.width, self.height, self.base_radius, self.vertices, self.friction, self.brownian_d,
-                self.curvature_relax, self.radial_relax, self.protrusion_gain, self.impulse, self.ruffle_std, self.rng
-            ) for _ in range(self.nb_cells)
-        ]
+        n = self.nb_cells
+        self.base_r = self.base_radius * (0.85 + 0.3 * self.rng.random(n))
+        self.area0 = math.pi * self.base_r ** 2
+        self.r = np.repeat(self.base_r[:, None], self.vertices, axis=1)
+        self.centers = self.rng.uniform((0, 0), (self.width, self.height), size=(n, 2))
+        self.vel = np.zeros((n, 2))
+        self._update_vertices()
         self._last_time = time.perf_counter()
         self._cell_layer = pygame.Surface((self.width, self.height))
+        self._cell_layer.fill((235, 235, 235))
+        # pixel boxes covered by cells in the previous frame (x0, y0, x1, y1)
+        self._boxes = np.zeros((n, 4), dtype=np.int64)
 
     def get_frame(self, mask: np.ndarray) -> pygame.Surface:
         now = time.perf_counter()
         dt = now - self._last_time
         self._last_time = now
 
-        if mask.dtype != np.bool_:
-            mask = mask.astype(bool)
-
-        if mask.any():
-            for c in self._cells:
-                c.stimulate(mask)
-
-        for c in self._cells:
-            c.update(dt)
-        for a, b in itertools.combinations(self._cells, 2):
-            a.collide(b)
-
-        self._cell_layer.fill((235, 235, 235))
-        for c in self._cells:
-            c.draw(self._cell_layer)
-
-        frame = self._microscope_filter(self._cell_layer.copy())
-
-        if self.overlay_mask:
-            # Overlay the mask as a blue semi-transparent layer, after filtering
-            mask_surf = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            blue_rgb = (50, 140, 255)
-            alpha = 128  # semi-transparent
-            mask_surf.fill((0, 0, 0, 0))
-            arr_rgb = pygame.surfarray.pixels3d(mask_surf)
-            arr_alpha = pygame.surfarray.pixels_alpha(mask_surf)
+        # idle frames (all-zero mask) skip the bool conversion entirely;
+        # one-byte masks are reinterpreted as bool without a copy
+        stimulated = bool(mask.any())
+        if stimulated and mask.dtype != np.bool_:
+            mask = mask.view(np.bool_) if mask.itemsize == 1 else mask.astype(bool)
+
+        if stimulated:
+            self._stimulate_cells(
+                mask, self.vx, self.vy, self.centers, self.vel, self.r, self.base_r, self.area0,
+                self._sin_dtheta, self.protrusion_gain, self.impulse, self.width, self.height
+            )
+
+        n = self.nb_cells
+        amp = self.rng.normal(0, math.sqrt(2 * self.brownian_d * dt), n)
+        ang = self.rng.uniform(0, 2 * math.pi, n)
+        ruffle = self.rng.normal(0, self.ruffle_std * self.base_r)
+        harmonic = self.rng.integers(1, 4, n)
+        phase = self.rng.uniform(0, 2 * math.pi, n)
+        self._update_cells(
+            self.centers, self.vel, self.r, self._harm_cos, self._harm_sin, self.base_r, self.area0,
+            self._sin_dtheta, amp, ang, harmonic, ruffle * np.cos(phase), ruffle * np.sin(phase),
+            dt, self.friction, self.curvature_relax, self.radial_relax, self.width, self.height
+        )
+        self._collide()
+        self._update_vertices()
+
+        # restore the background under last frame's cells, then draw
+        pixels = pygame.surfarray.pixels3d(self._cell_layer)
+        clear_boxes(pixels, self._boxes, 235)
+        rasterize_cells(pixels, self.vx, self.vy, self.centers, self.r, self.base_r, self._boxes)
+        del pixels  # unlock the surface
+
+        lum = self._microscope_filter(self._cell_layer)
+        # write the grey frame straight into the pixels of the returned surface
+        frame = pygame.Surface((self.width, self.height))
+        rgb = pygame.surfarray.pixels3d(frame)
+        rgb[...] = lum[..., None]
+
+        if self.overlay_mask and stimulated:
+            # Overlay the mask as a blue tint, after filtering.  Saturating
+            # add, as the former BLEND_RGBA_ADD blit of the mask surface.
             # Flip mask axes to match pygame's (width, height) order
             mask_T = mask.T
-            arr_rgb[mask_T] = blue_rgb
-            arr_alpha[mask_T] = alpha
-            del arr_rgb, arr_alpha  # unlock the surface
-            frame.blit(mask_surf, (0, 0), special_flags=pygame.BLEND_RGBA_ADD)
+            tinted = rgb[mask_T].astype(np.int16) + np.array([50, 140, 255], dtype=np.int16)
+            rgb[mask_T] = np.minimum(tinted, 255)
+        del rgb  # unlock the surface
         return frame
 
-    def _microscope_filter(self, surface: pygame.Surface) -> pygame.Surface:
-        raw = pygame.image.tostring(surface, "RGB")
-        pil = Image.frombytes("RGB", (self.width, self.height), raw)
-        pil = pil.convert("L")
-        pil = ImageEnhance.Contrast(pil).enhance(self.contrast)
-        pil = pil.filter(ImageFilter.GaussianBlur(self.blur_rad))
-        arr = np.asarray(pil, dtype=np.float32)
-        arr += np.random.normal(0, self.noise_std, arr.shape)
-        arr = np.clip(arr, 0, 255).astype(np.uint8)
-        pil = Image.fromarray(arr, mode="L")
-        pil = ImageEnhance.Brightness(pil).enhance(self.brightness)
-        rgb = pil.convert("RGB")
-        return pygame.image.fromstring(rgb.tobytes(), rgb.size, "RGB")
+    # ---------------- collision ------------------
+    def _collide(self):
+        """
+        Push overlapping cells apart.  A uniform-grid broad phase yields
+        the candidate pairs: buckets are at least one cell diameter wide,
+        so any overlapping pair sits in neighbouring buckets.  All pairs
+        are then resolved at once and every cell moves by the sum of its
+        shifts.
+        """
+        if self.nb_cells < 2:
+            return
+        r_max = self.r.max(axis=1)
+        cell_size = 2 * r_max.max()
+        bounds = np.array([self.width, self.height], dtype=float)
+        grid = np.maximum(1, (bounds // cell_size).astype(np.int32))
+        cell_ij = (self.centers * grid / bounds).astype(np.int32) % grid
+        bucket = cell_ij[:, 0] * grid[1] + cell_ij[:, 1]
+        order = np.lexsort((cell_ij[:, 1], cell_ij[:, 0])).astype(np.int32)
+        starts = np.searchsorted(bucket[order], np.arange(grid.prod() + 1)).astype(np.int32)
+        i, j = candidate_pairs(cell_ij, order, starts, grid[0], grid[1])
+
+        # minimum-image separation on the torus
+        dv = self.centers[j] - self.centers[i]
+        dv -= bounds * np.round(dv / bounds)
+        dist = np.hypot(dv[:, 0], dv[:, 1])
+        overlap = r_max[i] + r_max[j] - dist
+        active = (overlap > 0) & (dist > 0)
+        if not active.any():
+            return
+        i, j, dv = i[active], j[active], dv[active]
+        shift = (0.5 * (overlap[active] + 0.5) / dist[active])[:, None] * dv
+        np.add.at(self.centers, i, -shift)
+        np.add.at(self.centers, j, shift)
+        np.mod(self.centers, bounds, out=self.centers)
+        self.vel[i] = 0
+        self.vel[j] = 0
+
+    # ---------------- helpers --------------------
+    def _update_vertices(self):
+        """
+        Cache the (N, V) vertex coordinates.  They are computed once per
+        frame, after collisions, and shared by drawing and by the next
+        frame's stimulation (the cell state does not change in between).
+        """
+        self.vx = self.centers[:, 0, None] + self.cos_ang * self.r
+        self.vy = self.centers[:, 1, None] + self.sin_ang * self.r
+
+    def _microscope_filter(self, surface: pygame.Surface) -> np.ndarray:
+        """
+        Grey-scale, low-contrast, blurred and noisy rendering of *surface*,
+        mimicking a transmitted-light camera image.  Works on 8/16-bit
+        integers with lookup tables for contrast and brightness.  Returns
+        the (W, H) uint8 grey values in pygame's axis order, in a buffer
+        reused by the next call.
+        """
+        rgb = pygame.surfarray.pixels3d(surface)  # (W, H, 3) view, locks the surface
+        # 8-bit fixed-point ITU-R 601 luma, as PIL's RGB -> L conversion;
+        # the uint16 loop is forced, NumPy 1.x would pick uint8 and overflow
+        term = self._lum_term
+        lum = np.multiply(rgb[..., 0], 77, out=self._lum16, dtype=np.uint16)
+        lum += np.multiply(rgb[..., 1], 150, out=term, dtype=np.uint16)
+        lum += np.multiply(rgb[..., 2], 29, out=term, dtype=np.uint16)
+        del rgb  # unlock the surface
+        lum >>= 8
+        # contrast around the mean grey value, as PIL's ImageEnhance.Contrast
+        mean = lum.mean()
+        contrast_lut = np.clip(np.rint((self._levels - mean) * self.contrast + mean), 0, 255)
+        grey = np.take(contrast_lut.astype(np.uint8), lum, out=self._grey, mode="clip")
+        # separable Gaussian blur, one pass per axis
+        taps = self._blur_taps
+        correlate1d(grey, taps, axis=0, output=self._blur_pass, mode="nearest")
+        blurred = correlate1d(self._blur_pass, taps, axis=1, output=self._blurred, mode="nearest")
+        noise = self.rng.standard_normal(out=self._noise_buf, dtype=np.float32)
+        noise *= self.noise_std
+        noisy = np.rint(noise, out=self._noisy, casting="unsafe")
+        noisy += blurred
+        np.clip(noisy, 0, 255, out=noisy)
+        brightness_lut = np.clip(np.rint(self._levels * self.brightness), 0, 255).astype(np.uint8)
+        return np.take(brightness_lut, noisy, out=self._grey, mode="clip")
@@ -0,0 +1,304 @@
+"""
+sim_kernels.py
+Numba kernels for the per-frame cell physics of microscope_sim.py.
+
+All kernels work in place on the structure-of-arrays cell state held by
+MicroscopeSim (centers, vel, r, angles, base_r, area0) and loop over the
+cells with ``prange``.  Random numbers are drawn by the caller and passed
+in, so the kernels stay deterministic for a given RNG state.
+
+The stimulation and update kernels walk the vertex ring of every cell.
+The vertex count is fixed per simulator, so these kernels are generated
+from source with V inlined (see make_update_kernel): the ring loops get
+constant trip counts and the wrap-around neighbour becomes a peeled last
+iteration instead of a modulo.  The generated modules are written to
+``__pycache__`` so numba can cache them like the other kernels.
+"""
+import functools
+import importlib.util
+import math
+import os
+import sys
+import types
+import numpy as np
+from numba import njit
+
+# numba can only cache kernels that live in a source file, so the
+# specialised kernels are written out next to numba's own cache files.
+# The directory may be missing or read-only (site-packages, shared
+# installs); the kernels are then built in memory without caching.
+_GENERATED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+
+_RING_KERNELS_SOURCE = """# generated by sim_kernels.py for V = {V}, do not edit
+import math
+from numba import njit, prange
+
+@njit(fastmath=True, boundscheck=False, cache={CACHE})
+def _clip_and_conserve_area(r, c, base_r, area0, sin_dtheta):
+    lo = 0.4 * base_r[c]
+    hi = 2.2 * base_r[c]
+    for v in range({V}):
+        r[c, v] = min(max(r[c, v], lo), hi)
+    # star polygon with uniform vertex spacing dtheta:
+    # area = 0.5 * sin(dtheta) * sum(r_v * r_(v+1))
+    acc = r[c, {V_LAST}] * r[c, 0]
+    for v in range({V_LAST}):
+        acc += r[c, v] * r[c, v + 1]
+    area = 0.5 * sin_dtheta * acc
+    if area > 0:
+        scale = math.sqrt(area0[c] / area)
+        for v in range({V}):
+            r[c, v] *= scale
+
+@njit(parallel=True, fastmath=True, boundscheck=False, cache={CACHE})
+def update_cells(centers, vel, r, harm_cos, harm_sin, base_r, area0, sin_dtheta, brown_amp,
+                 brown_ang, ruffle_k, ruffle_cos, ruffle_sin, dt, friction, curv, radial, W, H):
+    N = r.shape[0]
+    damp = max(0.0, 1.0 - friction * dt)
+    for c in prange(N):
+        vel[c, 0] += brown_amp[c] * math.cos(brown_ang[c])
+        vel[c, 1] += brown_amp[c] * math.sin(brown_ang[c])
+        centers[c, 0] = (centers[c, 0] + vel[c, 0] * dt) % W
+        centers[c, 1] = (centers[c, 1] + vel[c, 1] * dt) % H
+        vel[c, 0] *= damp
+        vel[c, 1] *= damp
+
+        # a*cos(k*theta + phi) = a*cos(phi)*cos(k*theta) - a*sin(phi)*sin(k*theta)
+        k = ruffle_k[c]
+        for v in range({V}):
+            r[c, v] += ruffle_cos[c] * harm_cos[k, v] - ruffle_sin[c] * harm_sin[k, v]
+        # discrete Laplacian on the vertex ring; keep the unrelaxed
+        # neighbours around so the update reads the old radii only
+        first = r[c, 0]
+        prev = r[c, {V_LAST}]
+        for v in range({V_LAST}):
+            cur = r[c, v]
+            lap = r[c, v + 1] + prev - 2.0 * cur
+            r[c, v] = cur + curv * lap + radial * (base_r[c] - cur)
+            prev = cur
+        cur = r[c, {V_LAST}]
+        lap = first + prev - 2.0 * cur
+        r[c, {V_LAST}] = cur + curv * lap + radial * (base_r[c] - cur)
+        _clip_and_conserve_area(r, c, base_r, area0, sin_dtheta)
+
+@njit(parallel=True, fastmath=True, boundscheck=False, cache={CACHE})
+def stimulate_cells(mask, vx, vy, centers, vel, r, base_r, area0, sin_dtheta, gain, impulse, W, H):
+    N = r.shape[0]
+    for c in prange(N):
+        cx = centers[c, 0]
+        cy = centers[c, 1]
+        sx = 0.0
+        sy = 0.0
+        nb_hit = 0
+        for v in range({V}):
+            x = vx[c, v]
+            y = vy[c, v]
+            # clipped lookup, off-screen vertices are masked out afterwards
+            ix = min(max(int(x), 0), W - 1)
+            iy = min(max(int(y), 0), H - 1)
+            hit = mask[iy, ix] & (x >= 0) & (x < W) & (y >= 0) & (y < H)
+            if hit:
+                r[c, v] += gain * base_r[c]
+                sx += x
+                sy += y
+                nb_hit += 1
+        if nb_hit == 0:
+            continue
+        _clip_and_conserve_area(r, c, base_r, area0, sin_dtheta)
+
+        dx = sx / nb_hit - cx
+        dy = sy / nb_hit - cy
+        n = math.sqrt(dx * dx + dy * dy)
+        if n > 0:
+            vel[c, 0] += dx / n * impulse
+            vel[c, 1] += dy / n * impulse
+"""
+
+@functools.lru_cache(maxsize=None)
+def _ring_kernels(V: int):
+    """
+    Load the vertex-ring kernels for *V* vertices from a generated module.
+    The file is only rewritten when the template changes, which keeps
+    numba's on-disk cache of the compiled kernels valid across runs.  If
+    the module cannot be written, the kernels are exec'd uncached instead.
+    """
+    name = f"sim_ring_kernels_v{V}"
+    path = os.path.join(_GENERATED_DIR, name + ".py")
+    source = _RING_KERNELS_SOURCE.format(V=V, V_LAST=V - 1, CACHE=True)
+    try:
+        with open(path) as f:
+            current = f.read()
+    except OSError:
+        current = None
+    try:
+        if current != source:
+            os.makedirs(_GENERATED_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(source)
+            os.replace(tmp, path)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        # registered so numba can re-import the module when loading its cache
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    except OSError:
+        sys.modules.pop(name, None)
+        module = types.ModuleType(name)
+        exec(_RING_KERNELS_SOURCE.format(V=V, V_LAST=V - 1, CACHE=False), module.__dict__)
+    return module
+
+def make_update_kernel(V: int):
+    """
+    Return ``update_cells(centers, vel, r, harm_cos, harm_sin, base_r, area0,
+    sin_dtheta, brown_amp, brown_ang, ruffle_k, ruffle_cos, ruffle_sin, dt,
+    friction, curv, radial, W, H)`` specialised for *V* vertices.
+
+    Brownian motion, ruffling and shape relaxation of every cell.  Cell *c*
+    gets a velocity impulse of length brown_amp[c] in direction
+    brown_ang[c] for this step.  The ruffle of cell *c* is
+    ``a * cos(k * angles + phi)`` with ``k = ruffle_k[c]``, given as
+    ``ruffle_cos[c] = a * cos(phi)`` and ``ruffle_sin[c] = a * sin(phi)``;
+    harm_cos and harm_sin tabulate ``cos(k * angles)`` and ``sin(k * angles)``
+    with one row per harmonic k.
+    """
+    return _ring_kernels(V).update_cells
+
+def make_stimulate_kernel(V: int):
+    """
+    Return ``stimulate_cells(mask, vx, vy, centers, vel, r, base_r, area0,
+    sin_dtheta, gain, impulse, W, H)`` specialised for *V* vertices.
+
+    Protrudes every vertex that falls on a True pixel of *mask* and kicks
+    the cell toward the mean of its stimulated vertices.  *vx*, *vy* are
+    the (N, V) vertex coordinates matching *centers* and *r*.
+    """
+    return _ring_kernels(V).stimulate_cells
+
+@njit(fastmath=True, cache=True)
+def _neighbour_offsets(g):
+    """Distinct bucket offsets of a 3-wide neighbourhood on a torus of *g* buckets."""
+    if g >= 3:
+        return (-1, 0, 1)
+    if g == 2:
+        return (0, 1, 1)
+    return (0, 0, 0)
+
+@njit(cache=True)
+def candidate_pairs(cell_ij, order, starts, gx, gy):
+    """
+    Broad phase of the collision test: return int32 arrays (i, j), i < j,
+    of every pair of cells in neighbouring buckets of the uniform grid
+    described by *cell_ij* (bucket of every cell), *order* (cells sorted
+    by bucket) and *starts* (CSR offsets of bucket ``bx * gy + by`` into
+    *order*).  Pairs are counted in a first pass and written in a second.
+    """
+    N = cell_ij.shape[0]
+    ox = _neighbour_offsets(gx)
+    oy = _neighbour_offsets(gy)
+    nx = min(gx, 3)
+    ny = min(gy, 3)
+    count = 0
+    for fill in range(2):
+        if fill:
+            pair_i = np.empty(count, dtype=np.int32)
+            pair_j = np.empty(count, dtype=np.int32)
+            count = 0
+        for a in range(N):
+            for p in range(nx):
+                bx = (cell_ij[a, 0] + ox[p]) % gx
+                for q in range(ny):
+                    by = (cell_ij[a, 1] + oy[q]) % gy
+                    bucket = bx * gy + by
+                    for k in range(starts[bucket], starts[bucket + 1]):
+                        b = order[k]
+                        if b <= a:
+                            continue
+                        if fill:
+                            pair_i[count] = a
+                            pair_j[count] = b
+                        count += 1
+    return pair_i, pair_j
+
+@njit(fastmath=True, cache=True)
+def clear_boxes(pixels, boxes, grey):
+    """Fill the pixel *boxes* (x0, y0, x1, y1), wrapped on the torus, with *grey*."""
+    W, H = pixels.shape[0], pixels.shape[1]
+    for c in range(boxes.shape[0]):
+        for px in range(boxes[c, 0], boxes[c, 2]):
+            wx = px % W
+            for py in range(boxes[c, 1], boxes[c, 3]):
+                wy = py % H
+                pixels[wx, wy, 0] = grey
+                pixels[wx, wy, 1] = grey
+                pixels[wx, wy, 2] = grey
+
+@njit(fastmath=True, cache=True)
+def rasterize_cells(pixels, vx, vy, centers, r, base_r, boxes):
+    """
+    Draw every cell, in cell order, into the (W, H, 3) uint8 *pixels* of
+    the cell layer, wrapping around the edges of the torus.
+
+    A cell is shaded in six layers, from (180, 180, 255) at the rim to
+    (96, 96, 255) at the centre, with a black one-pixel outline and a
+    (60, 60, 150) nucleus.  A pixel's layer follows from where the ray
+    from the centre through the pixel meets the polygon edge, so no
+    polygon is ever scan-converted.  The pixel box covered by each cell
+    is written to *boxes* as (x0, y0, x1, y1), end exclusive.
+    """
+    W, H = pixels.shape[0], pixels.shape[1]
+    N, V = r.shape
+    sector = V / (2 * math.pi)
+    for c in range(N):
+        cx = centers[c, 0]
+        cy = centers[c, 1]
+        max_r = 0.0
+        for v in range(V):
+            max_r = max(max_r, r[c, v])
+        nucleus = int(0.4 * base_r[c]) ** 2
+        x0 = int(math.floor(cx - max_r)) - 1
+        y0 = int(math.floor(cy - max_r)) - 1
+        x1 = min(int(math.ceil(cx + max_r)) + 2, x0 + W)
+        y1 = min(int(math.ceil(cy + max_r)) + 2, y0 + H)
+        boxes[c, 0] = x0
+        boxes[c, 1] = y0
+        boxes[c, 2] = x1
+        boxes[c, 3] = y1
+        for px in range(x0, x1):
+            dx = px - cx
+            wx = px % W
+            for py in range(y0, y1):
+                dy = py - cy
+                wy = py % H
+                d2 = dx * dx + dy * dy
+                if d2 <= nucleus:
+                    pixels[wx, wy, 0] = 60
+                    pixels[wx, wy, 1] = 60
+                    pixels[wx, wy, 2] = 150
+                    continue
+                # polygon edge k spans the pixel's direction
+                phi = math.atan2(dy, dx)
+                if phi < 0:
+                    phi += 2 * math.pi
+                k = min(int(phi * sector), V - 1)
+                kn = k + 1 if k < V - 1 else 0
+                ax = vx[c, k] - cx
+                ay = vy[c, k] - cy
+                ex = vx[c, kn] - cx - ax
+                ey = vy[c, kn] - cy - ay
+                # q = distance of the pixel / distance of the edge along the ray;
+                # pixels within half a pixel of the edge count as inside
+                q = (ex * dy - ey * dx) / (ex * ay - ey * ax)
+                gap = math.sqrt(d2) * (1 / q - 1) if q > 0 else max_r
+                if gap <= -0.5:
+                    continue
+                if gap < 0.5:
+                    shade = 0
+                    blue = 0
+                else:
+                    layer = min(6, max(1, int(math.ceil(6 * q))))
+                    shade = 80 + (100 * layer) // 6
+                    blue = 255
+                pixels[wx, wy, 0] = shade
+                pixels[wx, wy, 1] = shade
+                pixels[wx, wy, 2] = blue